@@ -1,10 +1,13 @@
+import importlib.util
+import io
 import os
+import re
+import threading
+import wave
 import streamlit as st
-from transformers import pipeline
-from typing import Dict
-from gtts import gTTS
-from together import Together
-from googletrans import Translator
+from functools import lru_cache
+from PIL import Image
+from typing import Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -24,6 +27,39 @@ SUPPORTED_LANGUAGES = {
     "ਪੰਜਾਬੀ (Punjabi)": "pa"
 }
 
+# Languages translated locally with a dedicated English-to-X model;
+# the rest fall back to Google Translate
+TRANSLATION_MODELS = {
+    "hi": "Helsinki-NLP/opus-mt-en-hi",
+    "ml": "Helsinki-NLP/opus-mt-en-ml",
+    "mr": "Helsinki-NLP/opus-mt-en-mr"
+}
+
+# Sentence ends for local translation, not splitting after common titles
+SENTENCE_BOUNDARY = re.compile(
+    r"(?<!\bMr\.)(?<!\bMrs\.)(?<!\bMs\.)(?<!\bDr\.)(?<!\bSt\.)(?<!\bJr\.)(?<=[.!?])\s+"
+)
+
+# Marker used to send several texts to Google Translate in a single request
+TRANSLATION_SEPARATOR = "\n\n###\n\n"
+
+# Optional local Piper voices (pip install "piper-tts>=1.3"), looked up as
+# voices/<language code>.onnx next to this file; other languages are narrated with gTTS
+VOICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voices")
+
+# Story preference selectors: key -> (label, options)
+STORY_PREFERENCES = {
+    'region': ("🗺️ Region", ("North India", "South India", "East India", "West India", "Central India")),
+    'genre': ("📚 Genre", ("Mythology", "Historical Fiction", "Bollywood-inspired Drama", "Folklore")),
+    'setting': ("🏛️ Setting", ("Ancient India", "Modern-day City", "Village Life", "Freedom Struggle Era")),
+    'plot': ("📝 Plot", ("Overcoming obstacles", "Family saga", "Love story", "Friendship and loyalty")),
+    'tone': ("🎭 Tone", ("Emotional", "Inspirational", "Humorous", "Mysterious")),
+    'theme': ("💫 Theme", ("Karma", "Unity in Diversity", "Tradition vs. Modernity", "Hope")),
+    'conflict': ("⚔️ Conflict Type", ("Class struggles", "Internal moral dilemma", "Man vs. Nature", "Generational conflict")),
+    'twist': ("🌀 Mystery/Twist", ("Reincarnation", "Hidden lineage", "Unexpected sacrifice", "Spiritual revelation")),
+    'ending': ("🎬 Ending", ("Happy", "Bittersweet", "Open-ended", "Tragic"))
+}
+
 # Custom color theme
 THEME = {
     'primary': '#FF6B6B',     # Warm Red
@@ -33,140 +69,293 @@ THEME = {
     'text': '#2C3E50'         # Dark Blue-Gray
 }
 
+# Custom CSS derived from THEME
+CUSTOM_CSS = f"""
+    <style>
+    .stApp {{
+        background-color: {THEME['background']};
+        color: {THEME['text']};
+    }}
+    .stButton>button {{
+        background-color: {THEME['primary']};
+        color: white;
+        border-radius: 10px;
+        padding: 0.5rem 1rem;
+        border: none;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+    }}
+    .stSelectbox {{
+        border-radius: 8px;
+        border: 2px solid {THEME['secondary']};
+    }}
+    .stExpander {{
+        background-color: white;
+        border-radius: 10px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+    }}
+    h1, h2, h3 {{
+        color: {THEME['primary']};
+    }}
+    .story-container {{
+        background-color: white;
+        padding: 20px;
+        border-radius: 10px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+        margin: 10px 0;
+    }}
+    </style>
+"""
+
 def set_custom_theme():
     """Apply custom CSS styling"""
-    st.markdown(f"""
-        <style>
-        .stApp {{
-            background-color: {THEME['background']};
-            color: {THEME['text']};
-        }}
-        .stButton>button {{
-            background-color: {THEME['primary']};
-            color: white;
-            border-radius: 10px;
-            padding: 0.5rem 1rem;
-            border: none;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }}
-        .stSelectbox {{
-            border-radius: 8px;
-            border: 2px solid {THEME['secondary']};
-        }}
-        .stExpander {{
-            background-color: white;
-            border-radius: 10px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        }}
-        h1, h2, h3 {{
-            color: {THEME['primary']};
-        }}
-        .story-container {{
-            background-color: white;
-            padding: 20px;
-            border-radius: 10px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-            margin: 10px 0;
-        }}
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 def initialize_session_state():
     """Initialize session state variables"""
     if "story_english" not in st.session_state:
         st.session_state.story_english = None
-    if "story_translated" not in st.session_state:
-        st.session_state.story_translated = None
-    if "audio_file_path" not in st.session_state:
-        st.session_state.audio_file_path = None
     if "caption" not in st.session_state:
         st.session_state.caption = None
     if "processing_complete" not in st.session_state:
         st.session_state.processing_complete = False
 
-def img2txt(url: str) -> str:
+@st.cache_resource(show_spinner=False)
+def get_caption_pipeline():
+    """Load the image captioning pipeline once per process"""
+    from transformers import pipeline
+
+    captioning_model = pipeline("image-to-text", model="Salesforce/blip-image-captioning-base")
+    # Warm up with a blank image so the first real caption doesn't pay for graph setup
+    captioning_model(Image.new("RGB", (224, 224)), max_new_tokens=1)
+    return captioning_model
+
+@st.cache_data(show_spinner=False)
+def caption_image(image_bytes: bytes) -> str:
+    """Caption an encoded image, cached by its content"""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Resize to BLIP's native 384x384 input up front, letting JPEGs decode at reduced
+    # scale; the processor stretches to this size anyway, so it no longer resamples
+    image.draft("RGB", (384, 384))
+    image = image.convert("RGB").resize((384, 384), Image.LANCZOS)
+    return get_caption_pipeline()(image, max_new_tokens=20)[0]["generated_text"]
+
+@st.cache_resource(show_spinner=False)
+def get_together_client():
+    """Create the Together client once so its HTTP connections are reused"""
+    from together import Together
+
+    return Together(api_key=os.environ.get("TOGETHER_API_KEY"))
+
+@st.cache_resource(show_spinner=False)
+def get_translator():
+    """Create the Google Translate client once so its HTTP connections are reused"""
+    from googletrans import Translator
+
+    return Translator()
+
+def img2txt(image_bytes: bytes) -> str:
     """Generate caption from image"""
     try:
-        captioning_model = pipeline("image-to-text", model="Salesforce/blip-image-captioning-base")
-        text = captioning_model(url, max_new_tokens=20)[0]["generated_text"]
-        return text
+        return caption_image(image_bytes)
     except Exception as e:
         st.error(f"Error in image captioning: {str(e)}")
         return None
 
-def txt2story(prompt: str) -> str:
-    """Generate story from prompt"""
-    try:
-        client = Together(api_key=os.environ.get("TOGETHER_API_KEY"))
-        
-        story_prompt = f"Write a short story of no more than 250 words based on the following prompt: {prompt}"
-        
-        stream = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
-            messages=[
-                {"role": "system", "content": '''As an experienced short story writer, write a meaningful story 
-                influenced by the provided prompt. Ensure the story does not exceed 250 words.'''},
-                {"role": "user", "content": story_prompt}
-            ],
-            top_k=5,
-            top_p=0.8,
-            temperature=1.5,
-            stream=True
-        )
-        
-        story = ''
-        for chunk in stream:
-            story += chunk.choices[0].delta.content
-        return story
-    except Exception as e:
-        st.error(f"Error in story generation: {str(e)}")
-        return None
+def txt2story(prompt: str) -> Iterator[str]:
+    """Stream story tokens generated from prompt; errors propagate to the caller"""
+    client = get_together_client()
+    
+    story_prompt = f"Write a short story of no more than 250 words based on the following prompt: {prompt}"
+    
+    stream = client.chat.completions.create(
+        model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+        messages=[
+            {"role": "system", "content": '''As an experienced short story writer, write a meaningful story 
+            influenced by the provided prompt. Ensure the story does not exceed 250 words.'''},
+            {"role": "user", "content": story_prompt}
+        ],
+        top_k=5,
+        top_p=0.8,
+        temperature=1.5,
+        stream=True
+    )
+    
+    for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+@st.cache_resource(show_spinner=False)
+def get_translation_pipeline(target_lang: str):
+    """Load the local translation model for a target language once per process"""
+    from transformers import pipeline
+
+    return pipeline("translation", model=TRANSLATION_MODELS[target_lang])
+
+def split_paragraphs(text: str) -> List[List[str]]:
+    """Split English text into paragraphs, each a list of sentences"""
+    paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text)]
+    return [SENTENCE_BOUNDARY.split(paragraph) for paragraph in paragraphs if paragraph]
+
+@st.cache_data(show_spinner=False)
+def translate_batch(texts: List[str], target_lang: str) -> List[str]:
+    """Translate several texts to target language, cached by text and language"""
+    if target_lang in TRANSLATION_MODELS:
+        try:
+            # Translate the sentences of all texts as a single batch, keeping paragraph breaks
+            documents = [split_paragraphs(text) for text in texts]
+            sentences = [
+                sentence
+                for paragraphs in documents
+                for paragraph in paragraphs
+                for sentence in paragraph
+            ]
+            outputs = get_translation_pipeline(target_lang)(sentences, batch_size=16)
+            translated = iter(output["translation_text"] for output in outputs)
+            return [
+                "\n\n".join(" ".join(next(translated) for _ in paragraph) for paragraph in paragraphs)
+                for paragraphs in documents
+            ]
+        except Exception:
+            # Local model unavailable (download, cache or weights), use Google Translate instead
+            pass
 
-def translate_text(text: str, target_lang: str) -> str:
-    """Translate text to target language"""
+    # googletrans sends one request per list item, so join the texts into one request
+    translator = get_translator()
+    combined = translator.translate(TRANSLATION_SEPARATOR.join(texts), dest=target_lang).text
+    parts = [part.strip() for part in combined.split(TRANSLATION_SEPARATOR.strip())]
+    if len(parts) == len(texts):
+        return parts
+    # Separator got mangled in translation, fall back to one request per text
+    return [translator.translate(text, dest=target_lang).text for text in texts]
+
+@st.cache_resource(show_spinner=False)
+def get_translation_memo():
+    """Create the in-process memo over translate_batch once, so it outlives script reruns"""
+    @lru_cache(maxsize=1024)
+    def translate_memoized(texts: Tuple[str, ...], target_lang: str) -> Tuple[str, ...]:
+        return tuple(translate_batch(list(texts), target_lang))
+
+    return translate_memoized
+
+def translate_texts(texts: List[str], target_lang: str) -> List[str]:
+    """Translate several texts to target language in one go"""
     if target_lang == "en":
-        return text
+        return list(texts)
     
     try:
-        translator = Translator()
-        translation = translator.translate(text, dest=target_lang)
-        return translation.text
+        return list(get_translation_memo()(tuple(texts), target_lang))
     except Exception as e:
         st.warning(f"Translation failed: {str(e)}. Showing original text.")
-        return text
+        return list(texts)
+
+def local_voice_path(language_code: str) -> Optional[str]:
+    """Path of the local Piper voice for a language, if one is installed"""
+    path = os.path.join(VOICES_DIR, f"{language_code}.onnx")
+    if os.path.exists(path) and importlib.util.find_spec("piper") is not None:
+        return path
+    return None
+
+@st.cache_resource(show_spinner=False)
+def get_piper_voice(voice_path: str):
+    """Load a local Piper voice once per process"""
+    from piper import PiperVoice
+
+    return PiperVoice.load(voice_path)
+
+@st.cache_data(show_spinner=False)
+def synthesize_speech(text: str, language_code: str) -> Tuple[bytes, str]:
+    """Render text as audio bytes and their MIME type, cached by text and language"""
+    buffer = io.BytesIO()
+    voice_path = local_voice_path(language_code)
+    if voice_path:
+        with wave.open(buffer, "wb") as wav_file:
+            get_piper_voice(voice_path).synthesize_wav(text, wav_file)
+        return buffer.getvalue(), "audio/wav"
 
-def create_audio(text: str, language_code: str) -> bool:
+    from gtts import gTTS
+
+    tts = gTTS(text=text, lang=language_code)
+    tts.write_to_fp(buffer)
+    return buffer.getvalue(), "audio/mp3"
+
+def create_audio(text: str, language_code: str) -> Optional[Tuple[bytes, str]]:
     """
-    Create audio file from text in specified language
+    Create audio from text in specified language
     Args:
         text (str): Text to convert to speech
         language_code (str): Language code (e.g., 'hi' for Hindi, 'en' for English)
     Returns:
-        bool: Success status of audio creation
+        Optional[Tuple[bytes, str]]: Audio data and its MIME type, or None if audio creation failed
     """
     try:
-        # Create audio file in specified language
-        tts = gTTS(text=text, lang=language_code)
-        tts.save("story_audio.mp3")
-        return True
+        # Create audio in memory in specified language
+        return synthesize_speech(text, language_code)
     except Exception as e:
         st.error(f"Error in audio generation: {str(e)}")
-        return False
+        return None
+
+@st.cache_resource(show_spinner=False)
+def prewarm_caption_pipeline() -> threading.Thread:
+    """Start loading the captioning model in the background, once per process"""
+    # Not attached to any session: the model is shared by the whole process
+    thread = threading.Thread(target=get_caption_pipeline, daemon=True)
+    thread.start()
+    return thread
 
 def get_user_preferences() -> Dict[str, str]:
     """Get user preferences for story generation"""
     return {
-        'region': st.selectbox("🗺️ Region", ["North India", "South India", "East India", "West India", "Central India"]),
-        'genre': st.selectbox("📚 Genre", ["Mythology", "Historical Fiction", "Bollywood-inspired Drama", "Folklore"]),
-        'setting': st.selectbox("🏛️ Setting", ["Ancient India", "Modern-day City", "Village Life", "Freedom Struggle Era"]),
-        'plot': st.selectbox("📝 Plot", ["Overcoming obstacles", "Family saga", "Love story", "Friendship and loyalty"]),
-        'tone': st.selectbox("🎭 Tone", ["Emotional", "Inspirational", "Humorous", "Mysterious"]),
-        'theme': st.selectbox("💫 Theme", ["Karma", "Unity in Diversity", "Tradition vs. Modernity", "Hope"]),
-        'conflict': st.selectbox("⚔️ Conflict Type", ["Class struggles", "Internal moral dilemma", "Man vs. Nature", "Generational conflict"]),
-        'twist': st.selectbox("🌀 Mystery/Twist", ["Reincarnation", "Hidden lineage", "Unexpected sacrifice", "Spiritual revelation"]),
-        'ending': st.selectbox("🎬 Ending", ["Happy", "Bittersweet", "Open-ended", "Tragic"])
+        key: st.selectbox(label, options)
+        for key, (label, options) in STORY_PREFERENCES.items()
     }
 
+@st.fragment
+def render_results():
+    """Display the story in the chosen language; a language change reruns only this part"""
+    st.markdown("---")
+    
+    # Language selector, kept in the fragment so switching skips captioning and generation
+    selected_language = st.selectbox(
+        "🗣️ Select Story Language",
+        tuple(SUPPORTED_LANGUAGES),
+        index=0,
+        key="story_language"
+    )
+    lang_code = SUPPORTED_LANGUAGES[selected_language]
+    
+    # Translate caption and story together
+    with st.spinner("🌐 Translating your tale..."):
+        caption, story = translate_texts(
+            [st.session_state.caption, st.session_state.story_english],
+            lang_code
+        )
+    
+    # Display caption
+    if caption:
+        with st.expander("📜 The Vision", expanded=True):
+            st.markdown(
+                f"<div class='story-container'>{caption}</div>",
+                unsafe_allow_html=True
+            )
+    
+    # Display story
+    if story:
+        with st.expander("📖 Your Tale Unfolds", expanded=True):
+            st.markdown(
+                f"<div class='story-container'>{story}</div>",
+                unsafe_allow_html=True
+            )
+    
+    # Generate audio in the selected language once the text is on screen
+    with st.spinner("🎙️ Recording the narration..."):
+        audio = create_audio(story, lang_code)
+    
+    # Display audio player with correct language indication
+    if audio:
+        audio_bytes, audio_format = audio
+        with st.expander(f"🎧 Listen to the Magic ({selected_language})", expanded=True):
+            st.audio(audio_bytes, format=audio_format)
+
 def main():
     # Page configuration
     st.set_page_config(
@@ -178,6 +367,9 @@ def main():
     # Initialize session state
     initialize_session_state()
     
+    # Load the captioning model while the user picks an image
+    prewarm_caption_pipeline()
+    
     # Apply custom theme
     set_custom_theme()
     
@@ -188,16 +380,6 @@ def main():
         </h1>
     """, unsafe_allow_html=True)
 
-    # Language selector in sidebar
-    selected_language = st.sidebar.selectbox(
-        "🗣️ Select Story Language",
-        list(SUPPORTED_LANGUAGES.keys()),
-        index=0
-    )
-
-    # Get the language code for the selected language
-    current_lang_code = SUPPORTED_LANGUAGES[selected_language]
-
     # Main layout
     col1, col2 = st.columns([2, 3])
 
@@ -214,23 +396,16 @@ def main():
         if uploaded_file is not None:
             # Display image
             st.markdown("## 🖼️ Your Magical Image")
-            bytes_data = uploaded_file.read()
-            with open("uploaded_image.jpg", "wb") as file:
-                file.write(bytes_data)
-            st.image(uploaded_file, use_column_width=True)
+            bytes_data = uploaded_file.getvalue()
+            st.image(bytes_data, use_column_width=True)
 
             # Generate story button
             if st.button("✨ Weave Your Story ✨"):
                 with st.spinner("🪄 Crafting your magical tale..."):
                     try:
                         # Generate image caption
-                        scenario = img2txt("uploaded_image.jpg")
+                        scenario = img2txt(bytes_data)
                         if scenario:
-                            st.session_state.caption = translate_text(
-                                scenario, 
-                                current_lang_code
-                            )
-
                             # Generate story
                             prompt = f"""Based on the image description: '{scenario}', 
                             create a {preferences['genre']} story set in {preferences['setting']} 
@@ -239,22 +414,21 @@ def main():
                             should be {preferences['conflict']}. The story should have a {preferences['twist']} 
                             and end with a {preferences['ending']} ending."""
                             
-                            story = txt2story(prompt)
+                            # Show the story as it is written
+                            story_placeholder = st.empty()
+                            try:
+                                story = story_placeholder.write_stream(txt2story(prompt))
+                            except Exception as e:
+                                # Discard a story cut short by a failed stream
+                                story_placeholder.empty()
+                                story = None
+                                st.error(f"Error in story generation: {str(e)}")
                             if story:
-                                # Store English version
+                                # Store English versions, translated when displayed
+                                st.session_state.caption = scenario
                                 st.session_state.story_english = story
-                                
-                                # Create translated version
-                                st.session_state.story_translated = translate_text(
-                                    story, 
-                                    current_lang_code
-                                )
-                                
-                                # Generate audio in the selected language
-                                if create_audio(st.session_state.story_translated, current_lang_code):
-                                    st.session_state.audio_file_path = "story_audio.mp3"
-                                
                                 st.session_state.processing_complete = True
+                                story_placeholder.empty()
 
                     except Exception as e:
                         st.error(f"✖️ An error occurred: {str(e)}")
@@ -262,28 +436,7 @@ def main():
 
         # Display results
         if st.session_state.processing_complete:
-            st.markdown("---")
-            
-            # Display caption
-            if st.session_state.caption:
-                with st.expander("📜 The Vision", expanded=True):
-                    st.markdown(
-                        f"<div class='story-container'>{st.session_state.caption}</div>",
-                        unsafe_allow_html=True
-                    )
-            
-            # Display story
-            if st.session_state.story_translated:
-                with st.expander("📖 Your Tale Unfolds", expanded=True):
-                    st.markdown(
-                        f"<div class='story-container'>{st.session_state.story_translated}</div>",
-                        unsafe_allow_html=True
-                    )
-            
-            # Display audio player with correct language indication
-            if st.session_state.audio_file_path and os.path.exists(st.session_state.audio_file_path):
-                with st.expander(f"🎧 Listen to the Magic ({selected_language})", expanded=True):
-                    st.audio(st.session_state.audio_file_path)
+            render_results()
 
     # Footer
     st.markdown("""